@@ -1,12 +1,19 @@
 import argparse
 import collections
+import inspect
 import rdkit.Chem as Chem
 import sys
+import torch
 import torch.utils.data as data
 
+from tcvaemolgen.preprocessing.molgraph_cache import MolGraphCache
+from tcvaemolgen.structures import MolGraph
 from tcvaemolgen.utils import path_utils
 import pdb
 
+# prefetch_factor/persistent_workers only exist on newer DataLoaders
+_LOADER_PARAMS = inspect.signature(data.DataLoader.__init__).parameters
+
 class MolDataset(data.Dataset):
     def __init__(self, raw_data, split_indices, args):
         self.args = args
@@ -18,10 +25,24 @@ class MolDataset(data.Dataset):
                 data.append(raw_data[split_index])
         else:
             data = raw_data
+            split_indices = range(len(raw_data))
         self.data = data
+        self.raw_indices = split_indices
+        
+        self.graph_cache = None
+        if getattr(args, 'graph_cache', None) is not None:
+            self.graph_cache = MolGraphCache(args.graph_cache)
+            # Looked up by raw.csv row, so it must match raw_data exactly
+            self.graph_cache.check([smiles for smiles, _ in raw_data], args)
 
     def __getitem__(self, index):
         smiles, label = self.data[index]
+        if self.graph_cache is not None:
+            atom_feats, path_input, path_mask = \
+                self.graph_cache[self.raw_indices[index]]
+            return smiles, label, atom_feats.size(0), \
+                   (path_input, path_mask), atom_feats
+        
         try:
             mol = self.cache[smiles]
         except KeyError:
@@ -39,7 +60,7 @@ class MolDataset(data.Dataset):
             #print(path_input.squeeze(0).shape)
             path_input = path_input.squeeze(0)  # Remove batch dimension
             path_mask = path_mask.squeeze(0)  # Remove batch dimension
-        return smiles, label, n_atoms, (path_input, path_mask)
+        return smiles, label, n_atoms, (path_input, path_mask), None
 
     def __len__(self):
         return len(self.data)
@@ -53,7 +74,7 @@ class Args:
 
 def combine_data(data):
     args = Args()
-    batch_smiles, batch_labels, batch_n_atoms, batch_path = zip(*data)
+    batch_smiles, batch_labels, batch_n_atoms, batch_path, _ = zip(*data)
 
     batch_path_inputs, batch_path_masks = zip(*batch_path)
     
@@ -65,20 +86,53 @@ def combine_data(data):
     else:
         batch_path_inputs = None
         batch_path_mask = None
+    if not isinstance(batch_labels[0], tuple):  # Ring data keeps pair labels
+        # Tensorize property labels here so the DataLoader can pin them
+        batch_labels = torch.as_tensor(batch_labels, dtype=torch.float32)
     return batch_smiles, batch_labels, (batch_path_inputs, batch_path_mask)
 
+def combine_mol_graph(data):
+    """Collate a batch and build its MolGraph inside the loader worker."""
+    batch_smiles, batch_labels, (batch_path_inputs, batch_path_mask) = \
+        combine_data(data)
+    if batch_path_mask is not None:
+        # The mask is 0/1, so ship it as bytes; it is widened on the GPU
+        batch_path_mask = batch_path_mask.byte()
+    batch_atom_feats = [x[4] for x in data]
+    if batch_atom_feats[0] is not None:  # Precomputed, skip RDKit
+        mol_graph = MolGraph.from_atom_features(batch_smiles, 
+                                                batch_atom_feats,
+                                                batch_path_inputs, 
+                                                batch_path_mask)
+    else:
+        mol_graph = MolGraph(batch_smiles, None, batch_path_inputs, 
+                             batch_path_mask, on_gpu=False)
+    # Contiguous here so the host->device copy moves the final layout
+    return batch_smiles, batch_labels.contiguous(), mol_graph.contiguous()
+
 def get_loader(raw_data, split_indices, args, sampler=None, shuffle=False,
-               num_workers=5, batch_size=0):    
+               num_workers=5, batch_size=0, pin_memory=True, 
+               prefetch_factor=2, persistent_workers=False, 
+               build_graphs=False):    
     mol_dataset = MolDataset(raw_data, split_indices, args)
 
     if batch_size == 0:
         batch_size = args.batch_size
 
+    worker_kwargs = {}
+    if num_workers > 0:
+        if 'prefetch_factor' in _LOADER_PARAMS:
+            worker_kwargs['prefetch_factor'] = prefetch_factor
+        if 'persistent_workers' in _LOADER_PARAMS:
+            worker_kwargs['persistent_workers'] = persistent_workers
+
     data_loader = data.DataLoader(
         mol_dataset,
         batch_size=batch_size,
         sampler=sampler,
         shuffle=(sampler is None),
-        collate_fn=combine_data,
-        num_workers=num_workers)
+        collate_fn=combine_mol_graph if build_graphs else combine_data,
+        num_workers=num_workers,
+        pin_memory=pin_memory and torch.cuda.is_available(),
+        **worker_kwargs)
     return data_loader
\ No newline at end of file
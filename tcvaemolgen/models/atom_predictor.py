@@ -190,6 +190,8 @@ class AtomPredictor(pl.LightningModule):
         parser.add_argument('--p_embed', default=True, type=bool)
         parser.add_argument('--ring_embed', default=True, type=bool)
         parser.add_argument('--no_truncate', default=False, type=bool)
+        parser.add_argument('--jit', action='store_true',
+                            help='TorchScript the attention softmax')
         
         # training specific (for this model)
         parser.add_argument('--epochs', default=90, type=int, metavar='N',
@@ -1,7 +1,8 @@
-import hashlib
+import functools
 import logging
 import math
 import matplotlib
+import secrets
 import sys
 
 import matplotlib.pyplot as plt
@@ -11,8 +12,6 @@ import os
 from PIL import Image
 import rdkit.Chem as Chem
 import rdkit.Chem.Draw as Draw
-import sklearn.metrics as metrics
-import time
 import torch
 import torch.nn as nn
 from collections import OrderedDict
@@ -23,6 +22,14 @@ from torch.utils.data.distributed import DistributedSampler
 from argparse import ArgumentParser
 
 import pytorch_lightning as pl
+from pytorch_lightning.overrides.data_parallel import \
+    LightningDistributedDataParallel
+
+try:
+    # segment_csr only exists from torch-scatter 2.0 on
+    from torch_scatter import segment_csr
+except ImportError:
+    segment_csr = None
 
 from concurrent.futures import ThreadPoolExecutor
 import threading
@@ -30,7 +37,7 @@ import threading
 #from models.mol_conv_net import MolConvNet
 from tcvaemolgen.datasets.mol_dataset import get_loader
 from tcvaemolgen.models.transformer import MoleculeTransformer
-from tcvaemolgen.structures import MolGraph, MolTree
+from tcvaemolgen.structures import MolTree
 from tcvaemolgen.structures import mol_features
 from tcvaemolgen.utils.data import read_smiles_from_file, read_smiles_multiclass,\
                                 read_splits, write_props
@@ -39,6 +46,21 @@ import pdb
 
 module_log = logging.getLogger('tcvaemolgen.atom_predictor')
 
+@functools.lru_cache(maxsize=4)
+def _load_raw(data_path, multi):
+    """Parse raw.csv once; shared by the train/val/test dataloaders."""
+    if multi:
+        raw_data = read_smiles_multiclass('%s/raw.csv' % data_path)
+        n_classes = len(raw_data[0][1])
+    else:
+        raw_data = read_smiles_from_file('%s/raw.csv' % data_path)
+        n_classes = 1
+    return raw_data, n_classes
+
+@functools.lru_cache(maxsize=16)
+def _load_splits(data_path, split_idx):
+    return read_splits('%s/split_%d.txt' % (data_path, split_idx))
+
 def drawmols(smiles_list, logger, batch_idx, current_epoch, mode):
     n_data = len(smiles_list)
     mols = []
@@ -101,51 +123,79 @@ class PropPredictor(pl.LightningModule):
         hidden_size = hparams.hidden_size
         self.n_classes = n_classes
         model = MoleculeTransformer(hparams)
-        self.all_pred_logits, self.all_labels = [], []
+        self._logit_buf, self._label_buf = None, None
+        self._n_train, self._n_valid = 0, 0
+        self._val_buffer = []
         if self.hparams.distributed_backend == 'dp':
             self.tp = ThreadPoolExecutor(max_workers=12)
         
-        if self.on_gpu:
-            model = model.cuda()
         self.model = model
-        if self.on_gpu:
-            self.model = self.model.cuda()
-
-        self.W_p_h = nn.Linear(model.output_size, hidden_size)  # Prediction
-        self.W_p_o = nn.Linear(hidden_size, n_classes)
-
-    def _aggregate_atom_h(self, atom_h, scope):
-        mol_h = []
-        for (st, le) in enumerate(scope):
-            cur_atom_h = atom_h.narrow(0, st, len(le['atoms']))
-            #self.log.debug(f'CUR_ATOM_H: {cur_atom_h.shape}')
-
-            if True:#self.hparams.agg_func == 'sum':
-                mol_h.append(cur_atom_h.sum(dim=0))
-            #elif self.hparams.agg_func == 'mean':
-            #    mol_h.append(cur_atom_h.mean(dim=0))
-            else:
-                assert(False)
-        mol_h = torch.stack(mol_h, dim=0)
+
+        self.head = nn.Sequential(                               # Prediction
+            nn.Linear(model.output_size, hidden_size),
+            nn.ReLU(inplace=True),
+            nn.Linear(hidden_size, n_classes))
+
+    @property
+    def device(self):
+        """Device of this module's (or dp replica's) parameters."""
+        return next(self.parameters()).device
+
+    def _aggregate_atom_h(self, atom_h, segment_ids, n_mols, indptr=None):
+        if segment_csr is not None and indptr is not None:
+            # Atoms of a molecule are contiguous, so reduce them in order
+            assert self.hparams.agg_func in ('sum', 'mean')
+            return segment_csr(atom_h, indptr, reduce=self.hparams.agg_func)
+
+        mol_h = atom_h.new_zeros(n_mols, atom_h.size(1))
+        mol_h.index_add_(0, segment_ids, atom_h)
+
+        if self.hparams.agg_func == 'mean':
+            counts = torch.bincount(segment_ids, minlength=n_mols)
+            mol_h = mol_h / counts.unsqueeze(1).to(mol_h.dtype)
+        elif self.hparams.agg_func != 'sum':
+            assert(False)
         return mol_h
     
     def _compute_acc(self, input_probs, target, n_classes=1):
         if n_classes > 1:
-            preds = np.argmax(input_probs, axis=1)
-            acc = np.mean(preds == target)
+            preds = torch.argmax(input_probs, dim=1)
         else:
-            preds = (input_probs > 0.5).astype(int)
-            acc = np.mean(preds == target)
-        return acc
+            preds = (input_probs > 0.5).to(target.dtype)
+        return (preds == target).float().mean()
 
     def _compute_auc(self, input_probs, target):
-        auc = metrics.roc_auc_score(y_true=target, y_score=input_probs)
-        return auc
+        """ROC-AUC on device via the Mann-Whitney rank statistic, with tied
+            scores given their average rank. 2D inputs are macro averaged
+            over columns, as in sklearn.metrics.roc_auc_score.
+        A column holding only one class gives NaN (0/0) rather than the
+            ValueError sklearn raises, so it also turns the macro average
+            into NaN.
+        """
+        if input_probs.dim() > 1:
+            return torch.stack([
+                self._compute_auc(input_probs[:, i], target[:, i])
+                for i in range(input_probs.size(1))]).mean()
+
+        order = torch.argsort(input_probs)
+        _, inverse, counts = torch.unique_consecutive(
+            input_probs[order], return_inverse=True, return_counts=True)
+        counts = counts.double()
+        avg_ranks = torch.cumsum(counts, dim=0) - (counts - 1) / 2
+        ranks = avg_ranks[inverse]
+
+        is_pos = target[order] > 0.5
+        n_pos = is_pos.sum().double()
+        n_neg = is_pos.numel() - n_pos
+        rank_sum = ranks[is_pos].sum()
+        return (rank_sum - n_pos * (n_pos + 1) / 2) / (n_pos * n_neg)
 
     def forward(self, mol_graph, step_idx, mode='None', output_attn=False):
         attn_list = None
+        draw_heatmaps = step_idx % 100 == 0
         #if self.hparams.model_type == 'transformer':
-        atom_h, attn_list = self.model(mol_graph)
+        atom_h, attn_list = self.model(mol_graph, 
+                                       output_attn=output_attn or draw_heatmaps)
         #else:
         #    atom_h = self.model(mol_graph, stats_tracker)
         
@@ -153,8 +203,8 @@ class PropPredictor(pl.LightningModule):
         #for in, row in enumerate(attn_list[0].detach()):
         #    at.append(row.squeeze().cpu().numpy())
         
-        heatmaps = [x.detach().clone() for x in attn_list]
-        if step_idx % 100 == 0:
+        if draw_heatmaps:
+            heatmaps = [x.detach().clone() for x in attn_list]
             if self.hparams.distributed_backend == 'dp':
                 _ = self.tp.submit(drawheatmaps(heatmaps,
                                             self.batch_sz,
@@ -173,10 +223,11 @@ class PropPredictor(pl.LightningModule):
                                             self.hparams)
         
 
-        scope = mol_graph.mols
-        mol_h = self._aggregate_atom_h(atom_h, scope)
-        mol_h = nn.ReLU()(self.W_p_h(mol_h))
-        mol_o = self.W_p_o(mol_h)
+        mol_h = self._aggregate_atom_h(atom_h, 
+                                       mol_graph.segment_ids, 
+                                       len(mol_graph.n_atoms),
+                                       mol_graph.indptr)
+        mol_o = self.head(mol_h)
         
         
 
@@ -186,14 +237,11 @@ class PropPredictor(pl.LightningModule):
             return mol_o, attn_list
                 
     def step(self, batch, batch_idx, mode='None'):
-        smiles_list, labels_list, path_tuple = batch
-        path_input, path_mask = path_tuple
-        #path_input, path_mask = path_input.squeeze(0), path_mask.squeeze(0)
-        if self.hparams.use_paths:
-            path_input = path_input
-            path_mask = path_mask
-            if self.on_gpu:
-                path_input, path_mask = path_input.cuda(), path_mask.cuda()
+        smiles_list, labels, mol_graph = batch
+        labels = labels.to(self.device, non_blocking=True)
+        mol_graph = mol_graph.to(self.device, non_blocking=True)
+        assert mol_graph.path_input is None or \
+            mol_graph.path_input.is_contiguous()
 
         n_data = len(smiles_list)
         if batch_idx % 500 == 0:
@@ -210,25 +258,17 @@ class PropPredictor(pl.LightningModule):
                                             self.current_epoch,
                                             mode)
         
-        
-        mol_graph = MolGraph(smiles_list, 
-                             self.hparams, 
-                             path_input, 
-                             path_mask, 
-                             batch_idx)
-        
         pred_logits = self(mol_graph, batch_idx, mode).squeeze(1)
-        labels = torch.tensor(labels_list, device='cuda').squeeze()
+        labels = labels.view_as(pred_logits)
         
         if self.hparams.loss_type == 'ce':  # memory issues
-            self.all_pred_logits.append(pred_logits)
-            self.all_labels.append(labels)
+            self._store_logits(pred_logits, labels)
 
         if self.hparams.loss_type == 'mse' or self.hparams.loss_type == 'mae':
-            loss = nn.MSELoss()(input=pred_logits, target=labels)
+            loss = F.mse_loss(input=pred_logits, target=labels)
         elif self.hparams.loss_type == 'ce':
-            pred_probs = nn.Sigmoid()(pred_logits)
-            loss = nn.BCELoss()(pred_probs, labels)
+            # Fused sigmoid + BCE stays numerically stable under fp16
+            loss = F.binary_cross_entropy_with_logits(pred_logits, labels)
         else:
             print("Improper Loss Type")
             assert(False)
@@ -236,30 +276,53 @@ class PropPredictor(pl.LightningModule):
         #labels_hat = torch.argmax(labels, dim=0)
         #stats_tracker.add_stat('loss', loss.item() * n_data, n_data)
 
-        loss = loss / self.hparams.batch_splits
+        # Gradient accumulation over batch_splits is done by the Trainer
         
-        acc = torch.sum(
-            pred_logits == labels
-        ).item() / (n_data * 1.0)
-        return loss, acc, loss, (smiles_list, labels_list, pred_logits)
+        # Kept on device; averaged once per epoch in validation/test_end
+        if self.hparams.loss_type == 'ce':
+            acc = ((pred_logits > 0) == labels.bool()).float().mean()
+        else:
+            acc = pred_logits.new_zeros(())
+        return loss, acc, loss, (smiles_list, labels, pred_logits)
+    
+    def _store_logits(self, pred_logits, labels):
+        if self._logit_buf is None:  # e.g. the sanity check before epoch 0
+            return
+        n_data = pred_logits.size(0)
+        offset = self._logit_offset[0]
+        self._logit_offset[0] = offset + n_data
+        if offset + n_data > self._logit_buf.size(0):
+            return
+        self._logit_buf[offset:offset + n_data].copy_(
+            pred_logits.detach().view(n_data, -1))
+        self._label_buf[offset:offset + n_data].copy_(labels.view(n_data, -1))
     
     def on_epoch_start(self):
-        self.all_pred_logits, self.all_labels = [], []
+        if self.hparams.loss_type == 'ce':
+            # Every train and validation prediction of the epoch is written
+            # into one preallocated buffer rather than a list of batches
+            n_total = self._n_train + self._n_valid
+            self._logit_buf = torch.empty(n_total, self.n_classes, 
+                                          device=self.device)
+            self._label_buf = torch.empty_like(self._logit_buf)
+            # Held in a list so updates made by dp replicas are shared
+            self._logit_offset = [0]
     
     def on_epoch_end(self):
         if self.hparams.loss_type == 'ce':
-            self.all_pred_logits = torch.cat(self.all_pred_logits, dim=0)
-            self.all_labels = torch.cat(self.all_labels, dim=0)
-            pred_probs = nn.Sigmoid()(self.all_pred_logits).detach().cpu().numpy()
-            self.all_labels = self.all_labels.detach().cpu().numpy()
-            acc = self._compute_acc(pred_probs, self.all_labels)
-            auc = self._compute_auc(pred_probs, self.all_labels)
+            n_total = min(self._logit_offset[0], self._logit_buf.size(0))
+            all_pred_logits = self._logit_buf[:n_total].squeeze(1)
+            all_labels = self._label_buf[:n_total].squeeze(1)
+            # Metrics are computed on device; only the two scalars are copied
+            pred_probs = torch.sigmoid(all_pred_logits)
+            acc = self._compute_acc(pred_probs, all_labels).item()
+            auc = self._compute_auc(pred_probs, all_labels).item()
             self.logger.experiment.log_metric('acc', acc,
                                               epoch=self.current_epoch)
             self.logger.experiment.log_metric('auc', auc,
                                               epoch=self.current_epoch)
             logger_logs = {"loss": auc, "acc": acc}
-            self.all_pred_logits, self.all_labels = [], []
+            self._logit_buf, self._label_buf = None, None
         
         self.logger.experiment.log_epoch_end(self.current_epoch)
         self.logger.experiment.send_notification(
@@ -276,49 +339,30 @@ class PropPredictor(pl.LightningModule):
     
     def training_step(self, batch, batch_idx):
         loss, _, mae, _ = self.step(batch, batch_idx, 'Train')
-        
-        self.logger.experiment.log_metric('train_loss', loss.detach().cpu(),
-                                          step=batch_idx, 
-                                          epoch=self.current_epoch)
-        
-        self.logger.experiment.log_metric('train_mae', mae.detach().cpu(),
-                                          step=batch_idx, 
-                                          epoch=self.current_epoch)
 
+        # Lightning only converts "log" to scalars every row_log_interval
+        # steps, but calls .item() on "progress_bar" every batch, so these
+        # stay out of the progress bar to avoid a per-step device->host sync
         if self.hparams.loss_type in ['mae', 'mse']:   
-            logger_logs = {"loss": loss, "train_mae": mae}
+            logger_logs = {"train_loss": loss, "train_mae": mae}
         else:
-            logger_logs = {"loss": loss}
+            logger_logs = {"train_loss": loss}
         return {
             'loss':loss,
-            "progress_bar": logger_logs, 
             "log": logger_logs
         }
     
     def validation_step(self, batch, batch_idx):
-        loss, acc, mae, (smiles_list, labels_list, pred_logits) = \
+        loss, acc, mae, (smiles_list, labels, pred_logits) = \
             self.step(batch, batch_idx, 'Val')
 
-        write_path = f'data/05_model_output/{self.hparams.data.split("/")[-1]}_{self.hparams.experiment_label}-valid_{self.current_epoch}'
-        if write_path is not None:
-            write_props(write_path, smiles_list, labels_list,
-                                    pred_logits.cpu().numpy())
-            
-        self.logger.experiment.log_metric('val_loss', loss.detach().cpu(),
-                                          step=batch_idx, 
-                                          epoch=self.current_epoch)
-        
-        self.logger.experiment.log_metric('val_acc', acc,
-                                          step=batch_idx, 
-                                          epoch=self.current_epoch)
-        
-        self.logger.experiment.log_metric('val_mae', mae.detach().cpu(),
-                                          step=batch_idx, 
-                                          epoch=self.current_epoch)
+        # Written out once in validation_end, avoiding a sync + file I/O
+        # per batch
+        self._val_buffer.append((smiles_list, labels, pred_logits.detach()))
 
         return {
             'val_loss': loss, 
-            'val_acc': torch.tensor(acc),
+            'val_acc': acc,
             'val_mae': mae
             #'smiles_list': smiles_list, 
             #'labels_list': labels_list,
@@ -330,57 +374,59 @@ class PropPredictor(pl.LightningModule):
         avg_loss = torch.stack([x['val_loss'] for x in outputs]).mean()
         avg_acc = torch.stack([x["val_acc"] for x in outputs]).mean()
         mae = torch.stack([x["val_mae"] for x in outputs]).mean()
-        """(smiles_list, labels_list, pred_logits) = outputs['smiles_list'],\
-                                                outputs['labels_list'],
-                                                outputs['pred_logits']"""
         
+        if self._val_buffer:
+            smiles_list, labels, pred_logits = zip(*self._val_buffer)
+            smiles_list = [s for batch in smiles_list for s in batch]
+            # numpy keeps float32 labels in their shortest form (-0.77, not
+            # -0.7699999809265137) when write_props formats them
+            labels = torch.cat(labels, dim=0).cpu().numpy()
+            pred_logits = torch.cat(pred_logits, dim=0).cpu().numpy()
+            self._val_buffer = []
+            
+            write_path = f'data/05_model_output/{self.hparams.data.split("/")[-1]}_{self.hparams.experiment_label}-valid_{self.current_epoch}'
+            write_props(write_path, smiles_list, labels, pred_logits)
         
         logger_logs = {"val_acc": avg_acc, "val_loss": avg_loss, "val_mae": mae}
         return {'avg_val_loss': avg_loss, "progress_bar": logger_logs, "log": logger_logs}
     
     def test_step(self, batch, batch_idx):
         loss, acc, mae, _ = self.step(batch, batch_idx, 'T  est')
-        
-        self.logger.experiment.log_metric('test_loss', loss.detach().cpu(),
-                                          step=batch_idx, 
-                                          epoch=self.current_epoch)
-        self.logger.experiment.log_metric('test_acc', acc,
-                                          step=batch_idx, 
-                                          epoch=self.current_epoch)
-        self.logger.experiment.log_metric('test_mae', mae.detach().cpu(),
-                                          step=batch_idx, 
-                                          epoch=self.current_epoch)
-
-        return {'test_loss':mae, 'test_acc': torch.tensor(acc), 'test_mae':mae}
+
+        return {'test_loss':mae, 'test_acc': acc, 'test_mae':mae}
     
     def test_end(self, outputs):
         # OPTIONAL
         avg_loss = torch.stack([x['test_loss'] for x in outputs]).mean()
+        avg_acc = torch.stack([x['test_acc'] for x in outputs]).mean()
         mae = torch.stack([x['test_mae'] for x in outputs]).mean()
         
-        logger_logs = {"test_mae": mae}
+        logger_logs = {"test_loss": avg_loss, "test_acc": avg_acc, "test_mae": mae}
         
-        return {'avg_test_loss': avg_loss, 'test_mae': mae}
+        return {'avg_test_loss': avg_loss, 'test_mae': mae, "log": logger_logs}
     
     def configure_optimizers(self):
         # REQUIRED
         # can return multiple optimizers and learning_rate schedulers
         return torch.optim.Adam(self.parameters(), 
                                 lr=self.hparams.learning_rate)
+    
+    def configure_ddp(self, model, device_ids):
+        # Every parameter gets a gradient on every batch, so skip the
+        # per-backward search for unused ones that Lightning turns on
+        model = LightningDistributedDataParallel(
+            model, device_ids=device_ids, find_unused_parameters=False)
+        return model
         
     @pl.data_loader
     def train_dataloader(self):
         split_idx = self.split_idx
         # REQUIRED
         train_dir = os.path.join(self.hparams.data, 'train')
-        if self.hparams.multi:
-            raw_data = read_smiles_multiclass('%s/raw.csv' % self.hparams.data)
-            n_classes = len(raw_data[0][1])
-            print(f'N_Classes: {n_classes}')
-        else:
-            raw_data = read_smiles_from_file('%s/raw.csv' % self.hparams.data)
-            n_classes = 1
-        data_splits = read_splits('%s/split_%d.txt' % (self.hparams.data, split_idx))
+        raw_data, n_classes = _load_raw(self.hparams.data, self.hparams.multi)
+        print(f'N_Classes: {n_classes}')
+        data_splits = _load_splits(self.hparams.data, split_idx)
+        self._n_train = len(data_splits['train'])
         train_dataset = get_loader(raw_data, 
                                    data_splits['train'], 
                                    self.hparams, 
@@ -403,7 +449,11 @@ class PropPredictor(pl.LightningModule):
                                    shuffle=True,
                                    sampler=train_sampler, 
                                    batch_size=self.hparams.batch_size,
-                                   num_workers=self.hparams.n_workers)
+                                   num_workers=self.hparams.n_workers,
+                                   pin_memory=self.hparams.pin_memory,
+                                   prefetch_factor=self.hparams.prefetch_factor,
+                                   persistent_workers=True,
+                                   build_graphs=True)
         
         return train_loader
 
@@ -414,14 +464,9 @@ class PropPredictor(pl.LightningModule):
         val_dir = os.path.join(self.hparams.data, 'valid')
         
         split_idx=0
-        if self.hparams.multi:
-            raw_data = read_smiles_multiclass('%s/raw.csv' % self.hparams.data)
-            n_classes = len(raw_data[0][1])
-        else:
-            raw_data = read_smiles_from_file('%s/raw.csv' % self.hparams.data)
-            n_classes = 1
-            
-        data_splits = read_splits('%s/split_%d.txt' % (self.hparams.data, split_idx))
+        raw_data, n_classes = _load_raw(self.hparams.data, self.hparams.multi)
+        data_splits = _load_splits(self.hparams.data, split_idx)
+        self._n_valid = len(data_splits['valid'])
         
         val_dataset = get_loader(raw_data, 
                                    data_splits['valid'], 
@@ -440,7 +485,12 @@ class PropPredictor(pl.LightningModule):
                                    data_splits['valid'], 
                                    self.hparams, 
                                    shuffle=False,
-                                   sampler=val_sampler)
+                                   sampler=val_sampler,
+                                   num_workers=self.hparams.n_workers,
+                                   pin_memory=self.hparams.pin_memory,
+                                   prefetch_factor=self.hparams.prefetch_factor,
+                                   persistent_workers=True,
+                                   build_graphs=True)
         
         return val_loader
 
@@ -451,13 +501,8 @@ class PropPredictor(pl.LightningModule):
         test_dir = os.path.join(self.hparams.data, 'test')
         
         split_idx=0
-        if self.hparams.multi:
-            raw_data = read_smiles_multiclass('%s/raw.csv' % self.hparams.data)
-            n_classes = len(raw_data[0][1])
-        else:
-            raw_data = read_smiles_from_file('%s/raw.csv' % self.hparams.data)
-            n_classes = 1
-        data_splits = read_splits('%s/split_%d.txt' % (self.hparams.data, split_idx))
+        raw_data, n_classes = _load_raw(self.hparams.data, self.hparams.multi)
+        data_splits = _load_splits(self.hparams.data, split_idx)
         
         test_dataset = get_loader(raw_data, 
                                    data_splits['test'], 
@@ -473,7 +518,10 @@ class PropPredictor(pl.LightningModule):
         test_loader = get_loader(raw_data, 
                                   data_splits['test'],
                                   self.hparams,
-                                  num_workers=0,
+                                  num_workers=self.hparams.n_workers,
+                                  pin_memory=self.hparams.pin_memory,
+                                  prefetch_factor=self.hparams.prefetch_factor,
+                                  build_graphs=True,
                                   shuffle=(test_sampler is None),
                                   sampler=test_sampler)
         
@@ -484,8 +532,6 @@ class PropPredictor(pl.LightningModule):
         """
         Specify the hyperparams for this LightningModule
         """
-        hash = hashlib.sha1()
-        hash.update(str(time.time()).encode('utf-8'))
         # MODEL specific
         parser = ArgumentParser(parents=[parent_parser])
         parser.add_argument('--learning_rate', default=0.02, type=float)
@@ -503,10 +549,19 @@ class PropPredictor(pl.LightningModule):
         parser.add_argument('--ring_embed', default=True, type=bool)
         parser.add_argument('--no_share', default=True, type=bool)
         parser.add_argument('--no_truncate', default=False, type=bool)
+        parser.add_argument('--jit', action='store_true',
+                            help='TorchScript the attention softmax')
         parser.add_argument('--agg_func', default='sum', type=str)
         parser.add_argument('--batch_splits', type=int, default=1,
                         help='Used to aggregate batches')
         parser.add_argument('--multi', type=bool, default=False)
+        parser.add_argument('--no_pin_memory', dest='pin_memory',
+                            action='store_false',
+                            help='do not pin DataLoader batches in memory')
+        parser.add_argument('--prefetch_factor', default=2, type=int,
+                            help='batches loaded in advance by each worker')
+        parser.add_argument('--graph_cache', default=None, type=str,
+                            help='dir written by preprocessing.molgraph_cache')
         
         # training specific (for this model)
         parser.add_argument('--epochs', default=100, type=int, metavar='N',
@@ -526,7 +581,7 @@ class PropPredictor(pl.LightningModule):
         parser.add_argument('--pretrained', dest='pretrained', 
                             action='store_true', help='use pre-trained model')
         parser.add_argument('--experiment_label', 
-                            default=hash.hexdigest()[:10])
+                            default=secrets.token_hex(5))
         parser.add_argument('--n_rounds', default=10, type=int)
         
         
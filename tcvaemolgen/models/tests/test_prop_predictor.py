@@ -0,0 +1,41 @@
+import argparse
+import math
+import numpy as np
+import pytest
+import sklearn.metrics as metrics
+import torch
+
+from tcvaemolgen.models.prop_predictor import PropPredictor
+
+
+@pytest.fixture
+def prop_predictor():
+    parser = PropPredictor.add_model_specific_args(
+        argparse.ArgumentParser(add_help=False))
+    hparams = parser.parse_args([])
+    hparams.distributed_backend = 'ddp'
+    return PropPredictor(hparams)
+
+
+def test_compute_auc(prop_predictor):
+    rng = np.random.RandomState(0)
+    # Scores rounded to one decimal so that many of them are tied
+    probs = np.round(rng.rand(200, 3), 1)
+    labels = (rng.rand(200, 3) > 0.6).astype(np.float32)
+
+    for i in range(probs.shape[1]):
+        auc = prop_predictor._compute_auc(torch.from_numpy(probs[:, i]),
+                                          torch.from_numpy(labels[:, i]))
+        target = metrics.roc_auc_score(labels[:, i], probs[:, i])
+        assert auc.item() == pytest.approx(target)
+
+    auc = prop_predictor._compute_auc(torch.from_numpy(probs),
+                                      torch.from_numpy(labels))
+    target = metrics.roc_auc_score(labels, probs)
+    assert auc.item() == pytest.approx(target)
+
+
+def test_compute_auc_single_class(prop_predictor):
+    probs = torch.tensor([0.1, 0.4, 0.8])
+    auc = prop_predictor._compute_auc(probs, torch.ones(3))
+    assert math.isnan(auc.item())
@@ -0,0 +1,40 @@
+import argparse
+import torch
+
+from tcvaemolgen.models.transformer import MoleculeTransformer
+
+
+def get_args():
+    return argparse.Namespace(max_path_length=3, p_embed=True,
+                              ring_embed=True, n_heads=2, d_k=8, depth=2,
+                              hidden_size=16, dropout=0., no_share=False,
+                              jit=False)
+
+
+def test_convert_to_3D():
+    model = MoleculeTransformer(get_args())
+    scope = [2, 4, 3]
+    max_atoms = max(scope)
+    # Row i holds value i, so each padded row shows where it was read from
+    input = torch.arange(sum(scope)).float().unsqueeze(1).repeat(1, 5)
+
+    for self_attn in [True, False]:
+        batch_input, batch_mask = model._convert_to_3D(
+            input, scope, max_atoms, self_attn=self_attn)
+        assert batch_input.size() == (len(scope), max_atoms, 5)
+        assert batch_mask.size() == (len(scope), max_atoms, max_atoms)
+
+        offset = 0
+        for mol_idx, n_atoms in enumerate(scope):
+            assert torch.equal(batch_input[mol_idx, :n_atoms],
+                               input[offset:offset + n_atoms])
+            assert (batch_input[mol_idx, n_atoms:] == 0).all()
+
+            target_mask = torch.zeros(max_atoms, max_atoms)
+            target_mask[:n_atoms, :n_atoms] = 1
+            if not self_attn:
+                target_mask.fill_diagonal_(0)
+            assert torch.equal(batch_mask[mol_idx], target_mask.byte())
+            offset += n_atoms
+
+        assert torch.equal(model._convert_to_2D(batch_input, scope), input)
@@ -3,6 +3,7 @@ __author__ = "David Longo (longodj@gmail.com)"
 """
 This file defines the core research contribution   
 """
+import functools
 import logging
 import os
 import torch
@@ -23,6 +24,28 @@ from tcvaemolgen.utils import path_utils
 
 module_log = logging.getLogger('tcvaemolgen.transformer')
 
+def masked_softmax(attn_scores, attn_mask, eps: float = 1e-20):
+    """Softmax over dim 2 restricted to the atoms selected by attn_mask."""
+    # max_scores is [batch, atoms, 1, 1], computed for stable softmax
+    max_scores = torch.max(attn_scores, dim=2, keepdim=True)[0]
+    # exp_attn is [batch, atoms, atoms, 1]
+    exp_attn = torch.exp(attn_scores - max_scores) * attn_mask
+    # sum_exp is [batch, atoms, 1, 1], add eps for stability
+    sum_exp = torch.sum(exp_attn, dim=2, keepdim=True) + eps
+
+    # attn_probs is [batch, atoms, atoms, 1]
+    return (exp_attn / sum_exp) * attn_mask
+
+@functools.lru_cache(maxsize=1)
+def _masked_softmax_jit():
+    """Scripting lets the JIT fuser run the pointwise softmax chain as one
+        kernel instead of one launch per op. Done on first use, so runs
+        without --jit never touch TorchScript, and cached at module level
+        since a ScriptFunction held on the module cannot be pickled for
+        ddp spawn.
+    """
+    return torch.jit.script(masked_softmax)
+
 class MoleculeTransformer(pl.LightningModule):
 
     def __init__(self, hparams):
@@ -69,6 +92,8 @@ class MoleculeTransformer(pl.LightningModule):
         
         self.dropout = nn.Dropout(hparams.dropout)
         self.output_size = hparams.hidden_size
+        if hparams.jit:
+            _masked_softmax_jit()  # Fail at construction, not mid-epoch
         
     
     def _avg_attn(self, attn_probs, n_heads, batch_sz, max_atoms):
@@ -80,24 +105,16 @@ class MoleculeTransformer(pl.LightningModule):
     def _compute_attn_probs(self, attn_input, attn_mask, layer_idx, eps=1e-20):
         # attn_scores is [batch, atoms, atoms, 1]
         if self.hparams.no_share:
-            attn_scores = nn.LeakyReLU(0.2)(
-                self.W_attn_h[layer_idx](attn_input))
+            attn_scores = F.leaky_relu(
+                self.W_attn_h[layer_idx](attn_input), 0.2)
             attn_scores = self.W_attn_o[layer_idx](attn_scores) * attn_mask
         else:
-            attn_scores = nn.LeakyReLU(0.2)(
-                self.W_attn_h(attn_input))
+            attn_scores = F.leaky_relu(
+                self.W_attn_h(attn_input), 0.2)
             attn_scores = self.W_attn_o(attn_scores) * attn_mask
 
-        # max_scores is [batch, atoms, 1, 1], computed for stable softmax
-        max_scores = torch.max(attn_scores, dim=2, keepdim=True)[0]
-        # exp_attn is [batch, atoms, atoms, 1]
-        exp_attn = torch.exp(attn_scores - max_scores) * attn_mask
-        # sum_exp is [batch, atoms, 1, 1], add eps for stability
-        sum_exp = torch.sum(exp_attn, dim=2, keepdim=True) + eps
-
-        # attn_probs is [batch, atoms, atoms, 1]
-        attn_probs = (exp_attn / sum_exp) * attn_mask
-        return attn_probs
+        softmax = _masked_softmax_jit() if self.hparams.jit else masked_softmax
+        return softmax(attn_scores, attn_mask, eps)
 
     def _compute_nei_score(self, attn_probs, path_mask):
         # Compute the fraction of attn weights in the neighborhood
@@ -110,14 +127,14 @@ class MoleculeTransformer(pl.LightningModule):
         """Convert back to 2D
         Args:
             input: A tensor of shape [batch size, max padding, # features]
-            scope: A list of start/length indices for the molecules
+            scope: A list of the number of atoms in each molecule
         Returns:
             A matrix of size [# atoms, # features]
         """
         input_2D = []
 
-        for idx, mol in enumerate(scope):
-            mol_input = input[idx].narrow(0, 0, len(mol['atoms']))
+        for idx, n_atoms in enumerate(scope):
+            mol_input = input[idx].narrow(0, 0, n_atoms)
             input_2D.append(mol_input)
 
         input_2D = torch.cat(input_2D, dim=0)
@@ -127,55 +144,26 @@ class MoleculeTransformer(pl.LightningModule):
         """Converts the input to a 3D batch matrix
         Args:
             input: A tensor of shape [# atoms, # features]
-            scope: A list of start/length indices for the molecules
+            scope: A list of the number of atoms in each molecule
             max_atoms: The maximum number of atoms for padding purposes
         Returns:
             A matrix of size [batch_size, max atoms, # features]
         """
         n_features = input.size()[1]
 
-        batch_input = []
-        batch_mask = []
-        for st, le in enumerate(scope):
-            length = len(le['atoms'])
-            mol_input = input.narrow(0, st, length).cuda()
-            if self.on_gpu:
-                mol_input = mol_input.cuda()
-            n_atoms = length
-            n_padding = max_atoms - length
-
-            mask = torch.ones([n_atoms], device='cuda')
-
-            if n_padding > 0:
-                z_padding = torch.zeros([n_padding], device='cuda')
-                z_pad_feats = torch.zeros([n_padding, n_features], device='cuda')
-                
-                #if self.on_gpu:
-                #    z_padding = z_padding.cuda()
-                #    z_pad_feats = z_pad_feats.cuda()
-                    
-                mask = torch.cat(
-                    [mask.cuda(), z_padding.cuda()]).cuda()
-                mol_input_padded = torch.cat(
-                    [mol_input.cuda(), z_pad_feats.cuda()]).cuda()
-                if self.on_gpu:
-                    mask, mol_input_padded = mask.cuda(), \
-                                             mol_input_padded.cuda()
-                batch_input.append(mol_input_padded)
-            else:
-                batch_input.append(mol_input)
-
-            # TEST
-            mask = mask.repeat([max_atoms, 1]) * mask.unsqueeze(1)
-            # mask = mask.repeat([max_atoms, 1])
-
-            if not self_attn:
-                for i in range(max_atoms):
-                    mask[i, i] = 0
-            batch_mask.append(mask.cuda())
-
-        batch_input = torch.stack(batch_input, dim=0)
-        batch_mask = torch.stack(batch_mask, dim=0).byte()
+        # Filled in place; replaces per-molecule padding + torch.stack
+        batch_input = input.new_zeros([len(scope), max_atoms, n_features])
+        batch_mask = input.new_zeros([len(scope), max_atoms, max_atoms])
+        offset = 0
+        for mol_idx, n_atoms in enumerate(scope):
+            batch_input[mol_idx, :n_atoms] = input.narrow(0, offset, n_atoms)
+            batch_mask[mol_idx, :n_atoms, :n_atoms] = 1
+            offset += n_atoms
+
+        if not self_attn:
+            batch_mask = batch_mask * \
+                (1 - torch.eye(max_atoms, device=input.device))
+        batch_mask = batch_mask.byte()
         return batch_input, batch_mask
     
     def _get_attn_input(self, atom_h, path_input, max_atoms):
@@ -187,35 +175,29 @@ class MoleculeTransformer(pl.LightningModule):
         atom_pairs_h = torch.cat([atom_h1, atom_h2], dim=3)
         #self.log.debug(atom_pairs_h.size())
         #self.log.debug(path_input.size())
-        if self.on_gpu:
-            atom_pairs_h = atom_pairs_h.cuda()
-            path_input = path_input.cuda()
         #print(f'pairs: {atom_pairs_h.shape}')
         #print(f'input: {path_input.shape}')
         attn_input = torch.cat([atom_pairs_h, path_input], dim=3)
 
         return attn_input
 
-    def forward(self, mol_graph):
+    def forward(self, mol_graph, output_attn=False):
+        """Returns atom embeddings and, if output_attn, the per-layer
+            attention maps (an empty list otherwise).
+        """
         atom_input, scope = mol_graph.get_atom_inputs()
-        max_atoms = len(max(scope, key=lambda x: len(x['atoms']))['atoms'])
+        max_atoms = max(scope)
         
         
         atom_input_3D, atom_mask = self._convert_to_3D(atom_input, 
                                                        scope, 
                                                        max_atoms, 
                                                        True) #Todo: self.hparams.self_attn
-        atom_input_3D = atom_input_3D
         attn_mask = atom_mask.float()
-        if self.on_gpu:
-            atom_input_3D = atom_input_3D.cuda()
-            attn_mask = attn_mask.cuda()
         attn_mask = attn_mask.unsqueeze(3)
 
                 
-        path_input, path_mask = mol_graph.path_input, mol_graph.path_mask
-        if self.on_gpu:
-            path_input, path_mask = path_input.cuda(), path_mask.cuda()
+        path_input, path_mask = mol_graph.path_input, mol_graph.path_mask.float()
         
         batch_sz, _, _ = atom_input_3D.size()
         n_heads, d_k = self.hparams.n_heads, self.hparams.d_k
@@ -243,8 +225,10 @@ class MoleculeTransformer(pl.LightningModule):
             attn_input = self._get_attn_input(atom_h, path_input, max_atoms)
 
             attn_probs = self._compute_attn_probs(attn_input, attn_mask, layer_idx)
-            attn_list.append(self._avg_attn(attn_probs, n_heads, batch_sz, max_atoms))
-            nei_scores.append(self._compute_nei_score(attn_probs, path_mask))
+            if output_attn:
+                attn_list.append(
+                    self._avg_attn(attn_probs, n_heads, batch_sz, max_atoms))
+                nei_scores.append(self._compute_nei_score(attn_probs, path_mask))
             attn_probs = self.dropout(attn_probs)
 
             if self.hparams.no_share:
@@ -253,7 +237,7 @@ class MoleculeTransformer(pl.LightningModule):
             else:
                 attn_h = self.W_message_h(
                     torch.sum(attn_probs * attn_input, dim=2))
-            atom_h = nn.ReLU()(attn_h + atom_input_h)
+            atom_h = F.relu(attn_h + atom_input_h)
 
         # Concat heads
         atom_h = atom_h.view(n_heads, batch_sz, max_atoms, -1)
@@ -263,13 +247,10 @@ class MoleculeTransformer(pl.LightningModule):
         #self.log.debug("converting to 2D")
         #self.log.debug(atom_input.shape)
         #self.log.debug(atom_h.shape)
-        if self.on_gpu:
-            atom_input = atom_input.cuda()
-            atom_h = atom_h.cuda()
-        atom_output = torch.cat([atom_input.cuda(), atom_h.cuda()], dim=1).cuda()
+        atom_output = torch.cat([atom_input, atom_h], dim=1)
         self.log.debug(atom_output.shape)
         atom_out = self.W_atom_o(atom_output)
-        atom_h = nn.ReLU()(atom_out)
+        atom_h = F.relu(atom_out)
         
         return atom_h, attn_list
 
@@ -414,6 +395,8 @@ class MoleculeTransformer(pl.LightningModule):
         parser.add_argument('--p_embed', default=True, type=bool)
         parser.add_argument('--ring_embed', default=True, type=bool)
         parser.add_argument('--no_truncate', default=False, type=bool)
+        parser.add_argument('--jit', action='store_true',
+                            help='TorchScript the attention softmax')
 
         # training specific (for this model)
         parser.add_argument('--epochs', default=90, type=int, metavar='N',
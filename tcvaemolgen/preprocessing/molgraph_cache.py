@@ -0,0 +1,158 @@
+"""Precompute per-molecule graph features into numpy memmaps.
+
+Atom features and path inputs/masks are stored structure-of-arrays style:
+    every molecule's rows are concatenated into one contiguous array per
+    feature, and n_atoms.npy gives the offsets. Arrays are indexed by the
+    row of the molecule in raw.csv. meta.json records the SMILES and path
+    options the cache was built from, so a stale cache can be detected.
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import numpy as np
+import torch
+import tqdm
+import rdkit.Chem as Chem
+
+from tcvaemolgen.preprocessing.shortest_paths import read_mol_smiles
+from tcvaemolgen.structures.mol_features import get_atom_features, \
+                                                N_ATOM_FEATS
+from tcvaemolgen.utils import path_utils
+
+CACHE_FILES = ['n_atoms', 'atom_feats', 'path_input', 'path_mask']
+PATH_ARGS = ['max_path_length', 'p_embed', 'ring_embed', 'self_attn',
+             'no_truncate']
+
+
+def get_path_args(args):
+    """The options that change the cached path features."""
+    return {name: getattr(args, name) for name in PATH_ARGS}
+
+
+def get_smiles_hash(smiles_list):
+    return hashlib.sha1('\n'.join(smiles_list).encode()).hexdigest()
+
+
+def write_molgraph_cache(smiles_list, shortest_paths, cache_dir, args):
+    """Writes the features of every molecule in smiles_list to cache_dir.
+
+    args must carry the path feature options used for training
+        (max_path_length, p_embed, ring_embed, self_attn, no_truncate).
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    rd_mols = [Chem.MolFromSmiles(smiles) for smiles in smiles_list]
+    n_atoms = np.array([mol.GetNumAtoms() for mol in rd_mols], dtype=np.int64)
+    n_path_feats = path_utils.get_num_path_features(args)
+
+    def open_array(name, shape, dtype):
+        return np.lib.format.open_memmap(
+            os.path.join(cache_dir, '%s.npy' % name), mode='w+',
+            dtype=dtype, shape=shape)
+
+    # Shapes must be Python ints; numpy >= 2 would write np.int64(...)
+    # into the .npy header, which np.load cannot parse back
+    n_total_atoms, n_total_pairs = int(n_atoms.sum()), int((n_atoms ** 2).sum())
+    atom_feats = open_array('atom_feats', (n_total_atoms, N_ATOM_FEATS),
+                            np.float32)
+    path_input = open_array('path_input', (n_total_pairs, n_path_feats),
+                            np.float32)
+    path_mask = open_array('path_mask', (n_total_pairs,), np.uint8)
+
+    a_offset, p_offset = 0, 0
+    for smiles, rd_mol, n in tqdm.tqdm(list(zip(smiles_list, rd_mols, n_atoms))):
+        atom_feats[a_offset:a_offset + n] = np.stack(
+            [get_atom_features(atom).numpy() for atom in rd_mol.GetAtoms()])
+
+        mol_input, mol_mask = path_utils.get_path_input(
+            [rd_mol], [shortest_paths[smiles]], n, args, output_tensor=False)
+        path_input[p_offset:p_offset + n * n] = mol_input.reshape(n * n, -1)
+        path_mask[p_offset:p_offset + n * n] = mol_mask.reshape(n * n)
+
+        a_offset += n
+        p_offset += n * n
+
+    np.save(os.path.join(cache_dir, 'n_atoms.npy'), n_atoms)
+    for array in [atom_feats, path_input, path_mask]:
+        array.flush()
+    with open(os.path.join(cache_dir, 'meta.json'), 'w') as f:
+        json.dump({'smiles_hash': get_smiles_hash(smiles_list),
+                   'path_args': get_path_args(args)}, f)
+
+
+class MolGraphCache:
+    """Read-only view of a cache written by write_molgraph_cache."""
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        n_atoms = np.load(os.path.join(cache_dir, 'n_atoms.npy'))
+        self.n_atoms = n_atoms
+        self.atom_offsets = np.concatenate([[0], np.cumsum(n_atoms)])
+        self.pair_offsets = np.concatenate([[0], np.cumsum(n_atoms ** 2)])
+        with open(os.path.join(cache_dir, 'meta.json')) as f:
+            meta = json.load(f)
+        self.smiles_hash = meta['smiles_hash']
+        self.path_args = meta['path_args']
+        self.arrays = None
+
+    def _open(self):
+        # Opened lazily so every DataLoader worker maps the files itself
+        # rather than receiving a pickled copy of the arrays
+        self.arrays = {
+            name: np.load(os.path.join(self.cache_dir, '%s.npy' % name),
+                          mmap_mode='r')
+            for name in CACHE_FILES[1:]}
+
+    def __len__(self):
+        return len(self.n_atoms)
+    
+    def check(self, smiles_list, args):
+        """Asserts the cache was built from smiles_list (all rows of
+            raw.csv, in order) with the same path options as args.
+        """
+        assert len(self) == len(smiles_list), \
+            'graph cache %s has %d molecules, raw data has %d' % (
+                self.cache_dir, len(self), len(smiles_list))
+        assert self.smiles_hash == get_smiles_hash(smiles_list), \
+            'graph cache %s was built from a different raw.csv' % \
+            self.cache_dir
+        assert self.path_args == get_path_args(args), \
+            'graph cache %s was built with path options %s, not %s' % (
+                self.cache_dir, self.path_args, get_path_args(args))
+
+    def __getitem__(self, mol_idx):
+        """Returns (atom_feats, path_input, path_mask) tensors for a row."""
+        if self.arrays is None:
+            self._open()
+        n = int(self.n_atoms[mol_idx])
+        a_st, p_st = self.atom_offsets[mol_idx], self.pair_offsets[mol_idx]
+
+        atom_feats = torch.from_numpy(
+            np.array(self.arrays['atom_feats'][a_st:a_st + n]))
+        path_input = torch.from_numpy(
+            np.array(self.arrays['path_input'][p_st:p_st + n * n]))
+        path_mask = torch.from_numpy(
+            np.array(self.arrays['path_mask'][p_st:p_st + n * n]))
+        return atom_feats, path_input.view(n, n, -1), path_mask.view(n, n)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-data_dir', type=str, default='')
+    parser.add_argument('-max_path_length', type=int, default=3)
+    parser.add_argument('-p_embed', type=bool, default=True)
+    parser.add_argument('-ring_embed', type=bool, default=True)
+    parser.add_argument('-self_attn', type=bool, default=True)
+    parser.add_argument('-no_truncate', type=bool, default=False)
+    args = parser.parse_args()
+
+    smiles_list = read_mol_smiles('%s/raw.csv' % args.data_dir)
+    shortest_paths = pickle.load(
+        open('%s/shortest_paths.p' % args.data_dir, 'rb'))
+    cache_dir = '%s/molgraph_cache' % args.data_dir
+    write_molgraph_cache(smiles_list, shortest_paths, cache_dir, args)
+    print('Saved MolGraph cache to: %s' % cache_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import pytest
+import rdkit.Chem as Chem
+import torch
+
+from tcvaemolgen.datasets.mol_dataset import MolDataset, combine_mol_graph
+from tcvaemolgen.preprocessing.molgraph_cache import MolGraphCache, \
+                                                    write_molgraph_cache
+from tcvaemolgen.preprocessing.shortest_paths import get_shortest_paths
+from tcvaemolgen.structures.mol_features import mol2tensors
+from tcvaemolgen.utils import path_utils
+from tcvaemolgen.utils.test_fixtures import smiles_set
+
+
+def get_args():
+    return argparse.Namespace(max_path_length=3, p_embed=True,
+                              ring_embed=True, self_attn=True,
+                              no_truncate=False)
+
+
+def write_cache(smiles_list, cache_dir, args):
+    mols = [Chem.MolFromSmiles(s) for s in smiles_list]
+    shortest_paths = {s: get_shortest_paths(m, 5)
+                      for s, m in zip(smiles_list, mols)}
+    write_molgraph_cache(smiles_list, shortest_paths, cache_dir, args)
+    return mols, shortest_paths
+
+
+def test_cache_round_trip(smiles_set, tmp_path):
+    args = get_args()
+    mols, shortest_paths = write_cache(smiles_set, str(tmp_path), args)
+
+    cache = MolGraphCache(str(tmp_path))
+    assert len(cache) == len(smiles_set)
+
+    for idx, (smiles, mol) in enumerate(zip(smiles_set, mols)):
+        n_atoms = mol.GetNumAtoms()
+        atom_feats, path_input, path_mask = cache[idx]
+        target_input, target_mask = path_utils.get_path_input(
+            [mol], [shortest_paths[smiles]], n_atoms, args,
+            output_tensor=False)
+
+        assert torch.equal(atom_feats, mol2tensors(mol)[0].float())
+        assert (path_input.numpy() == target_input[0]).all()
+        assert (path_mask.numpy() == target_mask[0]).all()
+
+
+def test_cached_collate(smiles_set, tmp_path):
+    args = get_args()
+    _, shortest_paths = write_cache(smiles_set, str(tmp_path), args)
+    args.use_paths, args.p_info = True, shortest_paths
+    raw_data = [(smiles, 0.) for smiles in smiles_set]
+
+    dataset = MolDataset(raw_data, None, args)
+    args.graph_cache = str(tmp_path)
+    cached_dataset = MolDataset(raw_data, None, args)
+
+    idx = list(range(len(smiles_set)))
+    _, labels, mol_graph = combine_mol_graph([dataset[i] for i in idx])
+    _, cached_labels, cached_graph = \
+        combine_mol_graph([cached_dataset[i] for i in idx])
+
+    assert torch.equal(labels, cached_labels)
+    assert cached_graph.n_atoms == mol_graph.n_atoms
+    for key in cached_graph._batch_tensors():
+        assert torch.equal(getattr(cached_graph, key),
+                           getattr(mol_graph, key)), key
+
+
+def test_stale_cache(smiles_set, tmp_path):
+    args = get_args()
+    _, shortest_paths = write_cache(smiles_set, str(tmp_path), args)
+    args.use_paths, args.p_info = True, shortest_paths
+    args.graph_cache = str(tmp_path)
+    raw_data = [(smiles, 0.) for smiles in smiles_set]
+
+    with pytest.raises(AssertionError):
+        MolDataset(raw_data[:-1], None, args)
+    with pytest.raises(AssertionError):
+        MolDataset(raw_data[::-1], None, args)
+    args.self_attn = False
+    with pytest.raises(AssertionError):
+        MolDataset(raw_data, None, args)
@@ -14,7 +14,7 @@ sys.path.insert(0,'/home/icarus/app/src')
 from tcvaemolgen.utils.chem import get_clique_mol, tree_decomp, get_mol, get_smiles, \
                        set_atommap, enum_assemble_nx, decode_stereo
 
-from .mol_features import get_atom_features, get_bond_features, mol2tensors, \
+from .mol_features import get_bond_features, mol2tensors, \
                             N_ATOM_FEATS, N_BOND_FEATS, MAX_NEIGHBORS
 from .vocab import Vocab
 
@@ -47,14 +47,35 @@ class MolGraph(Data):
         self.on_gpu = on_gpu
         self.smiles_list = smiles_list
         
-        self.mols : List[Data] = []
+        self.n_atoms : List[int] = []
         
         self.path_input = path_input
         self.path_mask = path_mask
         self.scope = []
-        self.rd_mols = []
         
         self._parse_molecules(smiles_list)
+    
+    @classmethod
+    def from_atom_features(cls, 
+                           smiles_list: List[str], 
+                           atom_feats: List[torch.Tensor],
+                           path_input=None,
+                           path_mask=None):
+        """Build a CPU MolGraph from precomputed per-molecule atom features
+            (see preprocessing.molgraph_cache), without calling RDKit.
+        """
+        mol_graph = cls(None, None)
+        mol_graph.hparams = None
+        mol_graph.on_gpu = False
+        mol_graph.smiles_list = smiles_list
+        mol_graph.n_atoms = [len(atoms) for atoms in atom_feats]
+        mol_graph.path_input = path_input
+        mol_graph.path_mask = path_mask
+        mol_graph.scope = []
+        
+        mol_graph.atom_inputs = torch.cat(atom_feats, dim=0).float()
+        mol_graph._set_segment_ids()
+        return mol_graph
         
     def _parse_molecules(self, smiles_list):
         """Turn the smiles into atom and bonds through rdkit.
@@ -66,56 +87,68 @@ class MolGraph(Data):
                 strings are valid.
             max_atoms: If provided, truncate graphs to this size.
         """
-        def skip_atom(atom_idx, max):
-            return (max != 0) and (atom_idx >= max)
-        
-        a_offset = 0
-        
-        graph_atoms, graph_bonds, graph_attr = None, None, None
-        
+        mol_atoms = []
         for smiles in smiles_list:
             rd_mol = Chem.MolFromSmiles(smiles)
-            self.rd_mols.append(rd_mol)
-            
-            atoms, bonds, attr = mol2tensors(rd_mol)
-            if self.on_gpu:
-                atoms, bonds, attr = \
-                    atoms.cuda(), bonds.cuda(), attr.cuda()
-
-            graph_atoms = torch.cat((graph_atoms, atoms), 0) \
-                            if graph_atoms is not None else atoms
-                            
-            graph_bonds = torch.cat((graph_bonds, bonds), 0)\
-                            if graph_bonds is not None else bonds
-            graph_attr = torch.cat((graph_attr, attr), 0) \
-                            if graph_attr is not None else attr
-                            
-            if self.on_gpu:
-                graph_atoms, graph_bonds, graph_attr = \
-                    graph_atoms.cuda(), graph_bonds.cuda(), graph_attr.cuda()
-
-            self.mols.append(dict({
-                'atoms':atoms, 
-                'bonds':bonds, 
-                'attr':attr
-            }))
-                
+            atoms, _, _ = mol2tensors(rd_mol)
+            mol_atoms.append(atoms)
         
-    def get_atom_inputs(self, output_tensors=True):
-        fatoms = []
+        # Only the concatenated atom features and the per-molecule sizes
+        # are kept, so a batch crosses from DataLoader workers as a few
+        # tensors rather than one per molecule
+        self.n_atoms = [len(atoms) for atoms in mol_atoms]
+        self.atom_inputs = torch.cat(mol_atoms, dim=0).float()
+        if self.on_gpu:
+            self.atom_inputs = self.atom_inputs.cuda()
+        self._set_segment_ids()
         
-        for mol_idx, mol in enumerate(self.mols):
-            atoms = self.rd_mols[mol_idx]
-            for atom_idx, atom in enumerate(atoms.GetAtoms()):
-                atom_features = get_atom_features(atom)
-                fatoms.append(atom_features)
+    def _set_segment_ids(self):
+        # segment_ids maps every atom in the batch to its molecule index,
+        # so per-molecule reductions can be done in a single scatter op
+        n_atoms = torch.tensor(self.n_atoms)
+        self.segment_ids = torch.repeat_interleave(
+            torch.arange(len(self.n_atoms)), n_atoms)
+        # CSR offsets of each molecule's atoms, [0, n1, n1+n2, ...]
+        self.indptr = torch.cat([n_atoms.new_zeros(1), n_atoms.cumsum(0)])
+        if self.on_gpu:
+            self.segment_ids = self.segment_ids.cuda()
+            self.indptr = self.indptr.cuda()
+                
         
-        fatoms = np.stack(fatoms, axis=0)
-        if output_tensors:
-            fatoms = torch.tensor(fatoms).float()
-            if self.on_gpu:
-                fatoms = fatoms.cuda()
-        return fatoms, self.mols
+    def get_atom_inputs(self, output_tensors=True):
+        fatoms = self.atom_inputs
+        if not output_tensors:
+            fatoms = fatoms.cpu().numpy()
+        return fatoms, self.n_atoms
+    
+    def _batch_tensors(self):
+        return ['atom_inputs', 'segment_ids', 'indptr', 
+                'path_input', 'path_mask']
+    
+    def contiguous(self):
+        for key in self._batch_tensors():
+            item = getattr(self, key)
+            if item is not None:
+                setattr(self, key, item.contiguous())
+        return self
+    
+    def pin_memory(self):
+        """Called by the DataLoader pin_memory thread."""
+        for key in self._batch_tensors():
+            item = getattr(self, key)
+            if item is not None:
+                setattr(self, key, item.pin_memory())
+        return self
+    
+    def to(self, device, non_blocking=False):
+        """Move the tensors consumed by the model to `device`."""
+        device = torch.device(device)
+        for key in self._batch_tensors():
+            item = getattr(self, key)
+            if item is not None:
+                setattr(self, key, item.to(device, non_blocking=non_blocking))
+        self.on_gpu = device.type == 'cuda'
+        return self
     
     def get_graph_inputs(self):
         fatoms = []
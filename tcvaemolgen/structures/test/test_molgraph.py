@@ -0,0 +1,31 @@
+import pytest
+
+from rdkit import Chem
+
+from tcvaemolgen.structures.mol_features import N_ATOM_FEATS
+from tcvaemolgen.structures.molgraph import MolGraph
+
+from tcvaemolgen.utils.test_fixtures import single_smiles, smiles_set
+
+def test_segment_ids(smiles_set):
+    mol_graph = MolGraph(smiles_set, None, on_gpu=False)
+    n_atoms = [Chem.MolFromSmiles(s).GetNumAtoms() for s in smiles_set]
+
+    assert mol_graph.segment_ids.size(0) == sum(n_atoms)
+    assert mol_graph.segment_ids.tolist() == \
+        [i for i, n in enumerate(n_atoms) for _ in range(n)]
+
+def test_indptr(smiles_set):
+    mol_graph = MolGraph(smiles_set, None, on_gpu=False)
+    n_atoms = [Chem.MolFromSmiles(s).GetNumAtoms() for s in smiles_set]
+
+    assert mol_graph.indptr.tolist() == \
+        [sum(n_atoms[:i]) for i in range(len(n_atoms) + 1)]
+
+def test_atom_inputs(smiles_set):
+    mol_graph = MolGraph(smiles_set, None, on_gpu=False)
+    n_atoms = [Chem.MolFromSmiles(s).GetNumAtoms() for s in smiles_set]
+    fatoms, scope = mol_graph.get_atom_inputs()
+
+    assert fatoms.size() == (sum(n_atoms), N_ATOM_FEATS)
+    assert scope == n_atoms
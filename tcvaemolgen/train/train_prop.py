@@ -98,6 +98,7 @@ def main(hparams):
 
     # most basic trainer, uses good defaults
     trainer = Trainer(
+        accumulate_grad_batches=hparams.batch_splits,
         check_val_every_n_epoch=1,
         default_save_path=f'data/05_model_outputs/{hparams.dataset}',
         distributed_backend=hparams.distributed_backend,
@@ -110,7 +111,8 @@ def main(hparams):
         log_save_interval=100,
         row_log_interval=10,    
         show_progress_bar=True,
-        track_grad_norm=2
+        track_grad_norm=2,
+        use_amp=hparams.use_16bit
     )
     for round_idx in range(hparams.n_rounds):
         model.split_idx = round_idx
@@ -140,7 +142,7 @@ if __name__ == '__main__':
     parser.add_argument('--use-paths', default=True, type=bool)
     parser.add_argument('--self_attn', default=True, type=bool)
     parser.add_argument('--dataset', default=None, type=str)
-    parser.add_argument('--use-16bit', dest='use-16bit', action='store_true',
+    parser.add_argument('--use-16bit', dest='use_16bit', action='store_true',
                         help='if true uses 16 bit precision')
 
     # give the module a chance to add own params